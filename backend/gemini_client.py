@@ -1,9 +1,23 @@
 import os
+import time
+import threading
+import logging
+import asyncio
+import hashlib
+import datetime
+from concurrent.futures import Future
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional, Type
 import google.generativeai as genai
+from google.generativeai import caching
+from pydantic import BaseModel, ValidationError
+from aiolimiter import AsyncLimiter
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Custom Exceptions
 class GeminiAPIError(Exception):
     """Raised when the Gemini API call fails."""
@@ -25,6 +39,44 @@ class GeminiAPIKeyMissingError(GeminiAPIError):
     pass
 
 
+# Response schemas (sent to Gemini as response_schema, used to validate replies)
+class ModuleDescription(BaseModel):
+    name: str
+    description: str
+
+
+class AnalysisResponse(BaseModel):
+    modules: List[ModuleDescription]
+    architecture: str
+    technical_debt: str
+    technical_debt_suggestions: str
+    onboarding_guide: str
+
+
+class AIIndicator(BaseModel):
+    indicator: str
+    severity: str
+    examples: List[str]
+    file_pattern: str
+
+
+class AIDetectionDetails(BaseModel):
+    comment_style_score: int
+    naming_convention_score: int
+    code_structure_score: int
+    documentation_pattern_score: int
+
+
+class AIDetectionResponse(BaseModel):
+    ai_percentage: int
+    confidence: str
+    human_percentage: int
+    indicators_found: List[AIIndicator]
+    summary: str
+    details: AIDetectionDetails
+    recommendation: str
+
+
 # Check for API key
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
@@ -36,16 +88,234 @@ if not GEMINI_API_KEY:
 # Configure Gemini API with API key
 genai.configure(api_key=GEMINI_API_KEY)
 
-# Initialize the Gemini model
-model = genai.GenerativeModel("gemini-3-pro-preview")
+GEMINI_MODEL_NAME = "gemini-3-pro-preview"
+
+# Static instructions live in system_instruction rather than being
+# prepended to every prompt
+ANALYSIS_SYSTEM_PROMPT = """You are a senior software architect analyzing a GitHub repository.
+
+Analyze the code and return a JSON object with this structure:
 
+{
+    "modules": [
+        {"name": "module_name", "description": "Brief description of what this module/folder does"}
+    ],
+    "architecture": "A detailed markdown description of the system architecture including: overall structure, design patterns, how components interact, and technology stack used.",
+    "technical_debt": "A markdown list of technical debt items: code quality issues, missing tests, outdated dependencies, security concerns, performance issues. If none found, explain why the code is well-maintained.",
+    "technical_debt_suggestions": "A markdown list of actionable suggestions for how to fix or address each technical debt item listed in 'technical_debt'. Each suggestion should reference the specific debt and provide a concrete improvement step.",
+    "onboarding_guide": "A markdown guide for new developers: how to set up the environment, key files to understand, how to run the project, and how to contribute."
+}
+
+Be thorough and specific in your analysis. Reference actual file names and code patterns you observe."""
+
+CHAT_SYSTEM_PROMPT = """You are an expert code assistant helping a developer understand a codebase.
+
+Provide a helpful, specific answer based on the actual code in the repository. Reference specific files, functions, or patterns when relevant. Keep your response concise but informative."""
+
+AI_DETECTION_SYSTEM_PROMPT = """You are an expert code analyst specializing in detecting AI-generated code.
+
+Analyze the codebase you are given and estimate what percentage of the code appears to be AI-generated.
+
+Look for these AI-generated code indicators:
+1. **Overly verbose comments** - AI tends to over-explain simple operations
+2. **Generic variable naming** - names like 'data', 'result', 'item', 'temp'
+3. **Boilerplate patterns** - standard templates without customization
+4. **Consistent formatting** - unnaturally perfect indentation and spacing
+5. **Defensive programming** - excessive error handling for simple cases
+6. **Tutorial-style code** - explanatory comments that read like documentation
+7. **Placeholder text** - comments like "TODO: implement this" or "Add your logic here"
+8. **Repetitive structures** - similar code blocks with minor variations
+9. **Common AI phrases** - "This function does X", "Here we handle", "Below we"
+10. **Missing project-specific context** - code that feels generic
 
-def call_gemini(prompt_text: str) -> str:
+Respond with JSON in this format:
+{
+    "ai_percentage": <number 0-100>,
+    "confidence": "<low|medium|high>",
+    "human_percentage": <number 0-100>,
+    "indicators_found": [
+        {
+            "indicator": "<indicator name>",
+            "severity": "<low|medium|high>",
+            "examples": ["<specific example from code>"],
+            "file_pattern": "<where this was found>"
+        }
+    ],
+    "summary": "<2-3 sentence summary of findings>",
+    "details": {
+        "comment_style_score": <0-100>,
+        "naming_convention_score": <0-100>,
+        "code_structure_score": <0-100>,
+        "documentation_pattern_score": <0-100>
+    },
+    "recommendation": "<advice for the developer>"
+}"""
+
+# Initialize the Gemini models
+model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+analysis_model = genai.GenerativeModel(GEMINI_MODEL_NAME, system_instruction=ANALYSIS_SYSTEM_PROMPT)
+chat_model = genai.GenerativeModel(GEMINI_MODEL_NAME, system_instruction=CHAT_SYSTEM_PROMPT)
+ai_detection_model = genai.GenerativeModel(GEMINI_MODEL_NAME, system_instruction=AI_DETECTION_SYSTEM_PROMPT)
+
+# Per-repo server-side context caches for chat, so follow-up questions
+# don't resend the whole repository
+CHAT_CONTEXT_TTL = datetime.timedelta(minutes=10)
+# Below this many tokens Gemini refuses to cache content, so don't try
+CHAT_CONTEXT_MIN_TOKENS = int(os.getenv("GEMINI_CACHE_MIN_TOKENS", "4096"))
+# How long a failed create is remembered before it is retried
+CHAT_CONTEXT_RETRY_AFTER = 600
+# sha256(repo_url + content) -> (expires_at, GenerativeModel or None if
+# caching failed)
+_chat_context_models = {}
+# Creates in flight, so concurrent first chats on a repo share one
+# (billed) CachedContent: key -> Future
+_chat_context_pending = {}
+# Guards the two dicts only; never held across an API call
+_chat_context_lock = threading.Lock()
+
+# Token-rate limiter: queue requests locally instead of hitting the
+# per-minute token quota and failing with 429s
+GEMINI_TOKENS_PER_MINUTE = int(os.getenv("GEMINI_TOKENS_PER_MINUTE", "3500000"))
+_token_limiter = AsyncLimiter(max_rate=GEMINI_TOKENS_PER_MINUTE, time_period=60)
+CHARS_PER_TOKEN = 4
+
+# Cap on Gemini calls in flight at once, so bursts queue here instead of
+# triggering rate-limit backoff
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+_gemini_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+
+def _estimate_tokens(prompt_text: str) -> int:
+    """Rough token estimate (~4 chars per token)."""
+    return max(1, min(len(prompt_text) // CHARS_PER_TOKEN, GEMINI_TOKENS_PER_MINUTE))
+
+
+# Input token budgets for repository content sent to Gemini
+PROMPT_TOKEN_BUDGET = int(os.getenv("GEMINI_PROMPT_TOKEN_BUDGET", "90000"))
+AI_DETECTION_TOKEN_BUDGET = 20_000
+
+
+def _clip_to_tokens(text: str, budget: int = PROMPT_TOKEN_BUDGET) -> str:
+    """
+    Clip text to roughly budget tokens, cutting at a line boundary.
+    Uses the chars/token estimate rather than count_tokens, which would
+    cost an extra API round trip per call.
+    """
+    max_chars = budget * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n", 0, max_chars)
+    if cut <= 0:
+        cut = max_chars
+    return text[:cut] + "\n... [truncated]"
+
+
+# Exact-match prompt cache: sha256(prompt) -> (expires_at, response_text)
+PROMPT_CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", "3600"))
+PROMPT_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", "256"))
+_prompt_cache = OrderedDict()
+
+
+def _prompt_key(prompt_text: str, schema: Optional[Type[BaseModel]] = None, gen_model=None) -> str:
+    # Schema identifies the task (and so the system instruction); the cached
+    # content name identifies the repo when it isn't part of the prompt
+    schema_name = schema.__name__ if schema else ""
+    cached_content = getattr(gen_model, "cached_content", None) or ""
+    namespace = f"{schema_name}\n{cached_content}"
+    return hashlib.sha256(f"{namespace}\n{prompt_text}".encode("utf-8")).hexdigest()
+
+
+def _json_config(schema: Type[BaseModel]):
+    return genai.types.GenerationConfig(
+        response_mime_type="application/json",
+        response_schema=schema,
+        temperature=0.0,
+        top_p=1.0,
+    )
+
+
+# Generation configs are built once and passed by reference on every call.
+# No max_output_tokens: thinking tokens count against it, and a truncated
+# reply would be invalid JSON.
+ANALYSIS_CONFIG = _json_config(AnalysisResponse)
+AI_DETECTION_CONFIG = _json_config(AIDetectionResponse)
+CHAT_CONFIG = None  # free text: model defaults
+_generation_configs = {
+    None: CHAT_CONFIG,
+    AnalysisResponse: ANALYSIS_CONFIG,
+    AIDetectionResponse: AI_DETECTION_CONFIG,
+}
+
+
+def _generation_config(schema: Optional[Type[BaseModel]]):
+    """Return the prebuilt generation config for schema (None means free text)."""
+    if schema not in _generation_configs:
+        _generation_configs[schema] = _json_config(schema)
+    return _generation_configs[schema]
+
+
+def _cache_get(key: str):
+    """Return the cached response for key, or None if missing/expired."""
+    entry = _prompt_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, response_text = entry
+    if expires_at < time.monotonic():
+        del _prompt_cache[key]
+        return None
+    _prompt_cache.move_to_end(key)
+    return response_text
+
+
+def _cache_put(key: str, response_text: str):
+    if PROMPT_CACHE_TTL <= 0:
+        return
+    _prompt_cache[key] = (time.monotonic() + PROMPT_CACHE_TTL, response_text)
+    _prompt_cache.move_to_end(key)
+    while len(_prompt_cache) > PROMPT_CACHE_MAX_ENTRIES:
+        _prompt_cache.popitem(last=False)
+
+
+def _raise_gemini_error(e: Exception):
+    """
+    Translate a raw SDK exception into one of our Gemini exceptions.
+    """
+    logger.error("Gemini error: %s: %s", type(e).__name__, e)
+    if isinstance(e, GeminiAPIError):
+        raise e
+    
+    error_msg = str(e).lower()
+    
+    if "timeout" in error_msg:
+        raise GeminiTimeoutError(
+            "Gemini API request timed out. "
+            "The repository may be too large. Try a smaller repository."
+        )
+    elif "quota" in error_msg or "rate" in error_msg:
+        raise GeminiAPIError(
+            "Gemini API rate limit exceeded. Please wait a moment and try again."
+        )
+    elif "invalid" in error_msg and "key" in error_msg:
+        raise GeminiAPIError(
+            "Invalid Gemini API key. Please check your GEMINI_API_KEY environment variable."
+        )
+    elif "connection" in error_msg or "network" in error_msg:
+        raise GeminiConnectionError(
+            "Unable to connect to Gemini API. "
+            "Please check your internet connection and try again."
+        )
+    else:
+        raise GeminiAPIError(f"Gemini API request failed: {str(e)}")
+
+
+def call_gemini(prompt_text: str, schema: Optional[Type[BaseModel]] = None) -> str:
     """
     Call Gemini API using the Google Generative AI SDK.
+    Blocking version, kept for scripts and tests; the API uses acall_gemini.
     
     Args:
         prompt_text: The prompt to send to Gemini
+        schema: Optional Pydantic model; when given, Gemini returns JSON matching it
     
     Returns:
         Response text from Gemini
@@ -53,45 +323,174 @@ def call_gemini(prompt_text: str) -> str:
     if not prompt_text or not isinstance(prompt_text, str):
         raise GeminiAPIError("Prompt cannot be empty")
     
+    key = _prompt_key(prompt_text, schema)
+    cached = _cache_get(key)
+    if cached is not None:
+        logger.debug("Gemini cache hit")
+        return cached
+    
     try:
-        print(f"Calling Gemini with prompt length: {len(prompt_text)} chars")
-        response = model.generate_content(prompt_text)
-        print(f"Gemini response received")
+        logger.info("Calling Gemini with prompt length: %d chars", len(prompt_text))
+        response = model.generate_content(
+            prompt_text,
+            generation_config=_generation_config(schema)
+        )
+        logger.info("Gemini response received")
         
         if not response.text:
             raise GeminiAPIError("Gemini API returned an empty response")
         
+        _cache_put(key, response.text)
         return response.text
     
     except Exception as e:
-        print(f"GEMINI ERROR: {type(e).__name__}: {str(e)}")
-        error_msg = str(e).lower()
-        
-        if "timeout" in error_msg:
-            raise GeminiTimeoutError(
-                "Gemini API request timed out. "
-                "The repository may be too large. Try a smaller repository."
-            )
-        elif "quota" in error_msg or "rate" in error_msg:
-            raise GeminiAPIError(
-                "Gemini API rate limit exceeded. Please wait a moment and try again."
-            )
-        elif "invalid" in error_msg and "key" in error_msg:
-            raise GeminiAPIError(
-                "Invalid Gemini API key. Please check your GEMINI_API_KEY environment variable."
-            )
-        elif "connection" in error_msg or "network" in error_msg:
-            raise GeminiConnectionError(
-                "Unable to connect to Gemini API. "
-                "Please check your internet connection and try again."
+        _raise_gemini_error(e)
+
+
+async def acall_gemini(prompt_text: str, schema: Optional[Type[BaseModel]] = None, gen_model=None) -> str:
+    """
+    Call Gemini API without blocking the event loop.
+    
+    Args:
+        prompt_text: The prompt to send to Gemini
+        schema: Optional Pydantic model; when given, Gemini returns JSON matching it
+        gen_model: Model to use (e.g. one with a system instruction); defaults to model
+    
+    Returns:
+        Response text from Gemini
+    """
+    if not prompt_text or not isinstance(prompt_text, str):
+        raise GeminiAPIError("Prompt cannot be empty")
+    
+    gen_model = gen_model or model
+    key = _prompt_key(prompt_text, schema, gen_model)
+    cached = _cache_get(key)
+    if cached is not None:
+        logger.debug("Gemini cache hit")
+        return cached
+    
+    try:
+        await _token_limiter.acquire(_estimate_tokens(prompt_text))
+        logger.info("Calling Gemini (async) with prompt length: %d chars", len(prompt_text))
+        async with _gemini_semaphore:
+            response = await gen_model.generate_content_async(
+                prompt_text,
+                generation_config=_generation_config(schema)
             )
-        else:
-            raise GeminiAPIError(f"Gemini API request failed: {str(e)}")
+        logger.info("Gemini response received")
+        
+        if not response.text:
+            raise GeminiAPIError("Gemini API returned an empty response")
+        
+        _cache_put(key, response.text)
+        return response.text
+    
+    except Exception as e:
+        _raise_gemini_error(e)
+
+
+async def astream_gemini(prompt_text: str, gen_model=None) -> AsyncIterator[str]:
+    """
+    Stream a Gemini reply chunk by chunk as it is generated.
+    
+    Args:
+        prompt_text: The prompt to send to Gemini
+        gen_model: Model to use; defaults to model
+    
+    Yields:
+        Text chunks of the response
+    """
+    if not prompt_text or not isinstance(prompt_text, str):
+        raise GeminiAPIError("Prompt cannot be empty")
+    
+    gen_model = gen_model or model
+    key = _prompt_key(prompt_text, gen_model=gen_model)
+    cached = _cache_get(key)
+    if cached is not None:
+        logger.debug("Gemini cache hit")
+        yield cached
+        return
+    
+    # The Gemini stream is pumped into a queue under the semaphore and
+    # yielded from outside it, so a slow client never holds a Gemini slot
+    chunks = asyncio.Queue()
+    
+    async def pump():
+        try:
+            async with _gemini_semaphore:
+                response = await gen_model.generate_content_async(
+                    prompt_text,
+                    generation_config=CHAT_CONFIG,
+                    stream=True
+                )
+                async for chunk in response:
+                    if chunk.text:
+                        chunks.put_nowait(chunk.text)
+        except Exception as e:
+            chunks.put_nowait(e)
+        finally:
+            chunks.put_nowait(None)
+    
+    parts = []
+    pump_task = None
+    try:
+        await _token_limiter.acquire(_estimate_tokens(prompt_text))
+        logger.info("Streaming Gemini with prompt length: %d chars", len(prompt_text))
+        pump_task = asyncio.create_task(pump())
+        while (item := await chunks.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            parts.append(item)
+            yield item
+    except Exception as e:
+        _raise_gemini_error(e)
+    finally:
+        # Reader went away mid-stream: stop generating
+        if pump_task is not None and not pump_task.done():
+            pump_task.cancel()
+    
+    if not parts:
+        raise GeminiAPIError("Gemini API returned an empty response")
+    _cache_put(key, "".join(parts))
+
+
+WARM_UP_TIMEOUT = 5
+
+
+async def warm_up_gemini():
+    """
+    Open the SDK's shared async channel at startup so the first request
+    doesn't pay connection + TLS setup. Failures are logged, not raised,
+    and startup waits at most WARM_UP_TIMEOUT seconds.
+    """
+    try:
+        await asyncio.wait_for(model.count_tokens_async("ping"), WARM_UP_TIMEOUT)
+        logger.info("Gemini connection ready")
+    except asyncio.TimeoutError:
+        logger.warning("Gemini warm-up timed out after %ss", WARM_UP_TIMEOUT)
+    except Exception as e:
+        logger.warning("Gemini warm-up failed: %s", e)
+
+
+def parse_analysis_response(response_text: str) -> dict:
+    """
+    Validate a JSON-mode analysis reply and convert it to the API shape
+    (modules as a name -> description mapping).
+    """
+    try:
+        analysis = AnalysisResponse.model_validate_json(response_text)
+    except ValidationError as e:
+        raise GeminiAPIError(f"Gemini returned an invalid analysis: {str(e)}")
+    
+    result = analysis.model_dump()
+    result["modules"] = {m.name: m.description for m in analysis.modules}
+    return result
 
 
 def build_prompt(code_text: str, repo_name: str) -> str:
     """
     Build a prompt for Gemini to analyze a repository.
+    Instructions are in ANALYSIS_SYSTEM_PROMPT; send this with analysis_model.
     
     Args:
         code_text: Concatenated code from the repository
@@ -100,181 +499,179 @@ def build_prompt(code_text: str, repo_name: str) -> str:
     Returns:
         Formatted prompt string
     """
-    return f"""You are a senior software architect analyzing the repository \"{repo_name}\".
-
-Analyze the code and return ONLY a valid JSON object (no markdown, no code blocks, no extra text) with this exact structure:
-
-{{
-    "modules": {{
-        "module_name": "Brief description of what this module/folder does"
-    }},
-    "architecture": "A detailed markdown description of the system architecture including: overall structure, design patterns, how components interact, and technology stack used.",
-    "technical_debt": "A markdown list of technical debt items: code quality issues, missing tests, security concerns, performance issues. If none found, explain why the code is well-maintained.",
-    "technical_debt_suggestions": "A markdown list of actionable suggestions for how to fix or address each technical debt item listed in 'technical_debt'. Each suggestion should reference the specific debt and provide a concrete improvement step.",
-    "onboarding_guide": "A markdown guide for new developers: how to set up the environment, key files to understand, how to run the project, and how to contribute."
-}}
-
-Return ONLY the JSON object, nothing else.
+    return f"""Repository: \"{repo_name}\"
 
 Code to analyze:
-{code_text}"""
+{_clip_to_tokens(code_text)}"""
 
 
-def analyze_repository(repo_content: str, repo_url: str) -> dict:
+async def analyze_repository(repo_content: str, repo_url: str) -> dict:
     """
     Analyze a repository using Gemini AI.
     Returns structured analysis with modules, architecture, tech debt, and onboarding guide.
     """
-    
-    prompt = f"""You are an expert code analyst. Analyze the following GitHub repository and provide a comprehensive analysis.
-
-Repository URL: {repo_url}
+    prompt = f"""Repository URL: {repo_url}
 
 Repository Content:
-{repo_content}
-
-Provide your analysis in the following JSON format (return ONLY valid JSON, no markdown):
-{{
-    "modules": {{
-        "module_name_1": "Description of what this module does",
-        "module_name_2": "Description of what this module does"
-    }},
-    "architecture": "A detailed markdown description of the system architecture, including:\\n- Overall structure\\n- Key design patterns used\\n- How components interact\\n- Technology stack",
-    "technical_debt": "A markdown list of technical debt items found, including:\\n- Code quality issues\\n- Missing tests\\n- Outdated dependencies\\n- Security concerns\\n- Performance issues",
-    "onboarding_guide": "A markdown guide for new developers including:\\n- How to set up the development environment\\n- Key files and folders to understand first\\n- How to run the project\\n- How to contribute"
-}}
-
-Be thorough and specific in your analysis. Reference actual file names and code patterns you observe.
-"""
+{_clip_to_tokens(repo_content)}"""
 
     try:
-        response_text = call_gemini(prompt)
-        
-        # Clean up response - remove markdown code blocks if present
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        if response_text.startswith("```"):
-            response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-        
-        import json
-        return json.loads(response_text.strip())
+        response_text = await acall_gemini(prompt, schema=AnalysisResponse, gen_model=analysis_model)
+        return parse_analysis_response(response_text)
     
     except Exception as e:
-        print(f"Gemini analysis error: {e}")
+        logger.error("Gemini analysis error: %s", e)
         return {
             "modules": {"error": "Failed to analyze modules"},
             "architecture": f"Analysis failed: {str(e)}",
             "technical_debt": "Unable to analyze technical debt",
+            "technical_debt_suggestions": "",
             "onboarding_guide": "Unable to generate onboarding guide"
         }
 
 
-def chat_about_repo(repo_content: str, repo_url: str, question: str, history: list) -> str:
+async def chat_about_repo(repo_content: str, repo_url: str, question: str, history: list) -> str:
     """
     Answer questions about the repository using Gemini AI.
     """
+    gen_model, prompt = await _prepare_chat(repo_content, repo_url, question, history)
     
-    # Build conversation history
-    history_text = ""
-    for msg in history[-10:]:  # Keep last 10 messages for context
-        role = "User" if msg.get("role") == "user" else "Assistant"
-        history_text += f"{role}: {msg.get('content', '')}\n"
+    try:
+        return await acall_gemini(prompt, gen_model=gen_model)
+    except Exception as e:
+        logger.error("Gemini chat error: %s", e)
+        return f"Sorry, I encountered an error: {str(e)}"
+
+
+async def stream_chat_about_repo(repo_content: str, repo_url: str, question: str, history: list) -> AsyncIterator[str]:
+    """
+    Streaming variant of chat_about_repo; yields the answer as it is generated.
+    """
+    gen_model, prompt = await _prepare_chat(repo_content, repo_url, question, history)
     
-    prompt = f"""You are an expert code assistant helping a developer understand a codebase.
+    try:
+        async for chunk in astream_gemini(prompt, gen_model=gen_model):
+            yield chunk
+    except Exception as e:
+        logger.error("Gemini chat error: %s", e)
+        yield f"Sorry, I encountered an error: {str(e)}"
 
-Repository URL: {repo_url}
 
-Repository Content:
-{repo_content}
+def clip_repo_content(repo_content: str) -> str:
+    """The part of repo_content chat sends to Gemini (what /chat needs stored)."""
+    return _clip_to_tokens(repo_content)
 
-Previous conversation:
-{history_text}
 
-User's question: {question}
+def _repo_context(repo_content: str, repo_url: str) -> str:
+    return f"""Repository URL: {repo_url}
+
+Repository Content:
+{_clip_to_tokens(repo_content)}"""
 
-Provide a helpful, specific answer based on the actual code in the repository. Reference specific files, functions, or patterns when relevant. Keep your response concise but informative.
-"""
 
+def _get_cached_chat_model(repo_content: str, repo_url: str):
+    """
+    Return a chat model bound to a server-side cached copy of the repository
+    content, or None if context caching isn't available (e.g. the content is
+    below Gemini's minimum cacheable size).
+    """
+    context = _repo_context(repo_content, repo_url)
+    if _estimate_tokens(context) < CHAT_CONTEXT_MIN_TOKENS:
+        return None
+    
+    key = _prompt_key(f"{repo_url}\n{repo_content}")
+    with _chat_context_lock:
+        now = time.monotonic()
+        entry = _chat_context_models.get(key)
+        if entry and entry[0] > now:
+            return entry[1]
+        
+        # Drop expired contexts
+        for stale in [k for k, (expires_at, _) in _chat_context_models.items() if expires_at <= now]:
+            del _chat_context_models[stale]
+        
+        pending = _chat_context_pending.get(key)
+        if pending is None:
+            pending = _chat_context_pending[key] = Future()
+            owner = True
+        else:
+            owner = False
+    
+    if not owner:
+        return pending.result()
+    
+    cached_model = None
     try:
-        return call_gemini(prompt)
+        cached = caching.CachedContent.create(
+            model=GEMINI_MODEL_NAME,
+            system_instruction=CHAT_SYSTEM_PROMPT,
+            contents=[context],
+            ttl=CHAT_CONTEXT_TTL,
+        )
+        cached_model = genai.GenerativeModel.from_cached_content(cached)
+        # Expire locally a little before the server does
+        expires_at = time.monotonic() + CHAT_CONTEXT_TTL.total_seconds() - 30
     except Exception as e:
-        print(f"Gemini chat error: {e}")
-        return f"Sorry, I encountered an error: {str(e)}"
+        logger.info("Context caching unavailable, sending repository inline: %s", e)
+        expires_at = time.monotonic() + CHAT_CONTEXT_RETRY_AFTER
+    
+    with _chat_context_lock:
+        _chat_context_models[key] = (expires_at, cached_model)
+        del _chat_context_pending[key]
+    pending.set_result(cached_model)
+    return cached_model
 
 
-def detect_ai_generated_code(repo_content: str) -> dict:
+async def _prepare_chat(repo_content: str, repo_url: str, question: str, history: list):
     """
-    Analyze code to detect patterns typical of AI-generated code.
-    Returns percentage estimates and indicators.
+    Pick the model and build the prompt for a chat turn. When the repository
+    is in a context cache only the history and question are sent.
     """
+    cached_model = None
+    if repo_content:
+        cached_model = await asyncio.to_thread(_get_cached_chat_model, repo_content, repo_url)
     
-    prompt = f"""You are an expert code analyst specializing in detecting AI-generated code.
+    if cached_model is not None:
+        return cached_model, _build_chat_prompt("", question, history)
+    return chat_model, _build_chat_prompt(_repo_context(repo_content, repo_url), question, history)
 
-Analyze the following codebase and estimate what percentage of the code appears to be AI-generated.
 
-Look for these AI-generated code indicators:
-1. **Overly verbose comments** - AI tends to over-explain simple operations
-2. **Generic variable naming** - names like 'data', 'result', 'item', 'temp'
-3. **Boilerplate patterns** - standard templates without customization
-4. **Consistent formatting** - unnaturally perfect indentation and spacing
-5. **Defensive programming** - excessive error handling for simple cases
-6. **Tutorial-style code** - explanatory comments that read like documentation
-7. **Placeholder text** - comments like "TODO: implement this" or "Add your logic here"
-8. **Repetitive structures** - similar code blocks with minor variations
-9. **Common AI phrases** - "This function does X", "Here we handle", "Below we"
-10. **Missing project-specific context** - code that feels generic
+def _build_chat_prompt(context: str, question: str, history: list) -> str:
+    """Build the chat prompt from optional repo context and the last 10 history messages."""
+    # Build conversation history
+    history_text = ""
+    for msg in history[-10:]:  # Keep last 10 messages for context
+        role = "User" if msg.get("role") == "user" else "Assistant"
+        history_text += f"{role}: {msg.get('content', '')}\n"
+    
+    return f"""{context}
 
-Repository Code:
-{repo_content[:80000]}
+Previous conversation:
+{history_text}
 
-Respond ONLY with valid JSON in this exact format:
-{{
-    "ai_percentage": <number 0-100>,
-    "confidence": "<low|medium|high>",
-    "human_percentage": <number 0-100>,
-    "indicators_found": [
-        {{
-            "indicator": "<indicator name>",
-            "severity": "<low|medium|high>",
-            "examples": ["<specific example from code>"],
-            "file_pattern": "<where this was found>"
-        }}
-    ],
-    "summary": "<2-3 sentence summary of findings>",
-    "details": {{
-        "comment_style_score": <0-100>,
-        "naming_convention_score": <0-100>,
-        "code_structure_score": <0-100>,
-        "documentation_pattern_score": <0-100>
-    }},
-    "recommendation": "<advice for the developer>"
-}}
+User's question: {question}
 """
 
+
+async def detect_ai_generated_code(repo_content: str) -> dict:
+    """
+    Analyze code to detect patterns typical of AI-generated code.
+    Returns percentage estimates and indicators.
+    """
+    prompt = f"""Repository Code:
+{_clip_to_tokens(repo_content, AI_DETECTION_TOKEN_BUDGET)}"""
+
     try:
-        response_text = call_gemini(prompt)
-        
-        # Clean up response
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        if response_text.startswith("```"):
-            response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-        
-        import json
-        result = json.loads(response_text.strip())
+        response_text = await acall_gemini(prompt, schema=AIDetectionResponse, gen_model=ai_detection_model)
+        result = AIDetectionResponse.model_validate_json(response_text).model_dump()
         
         # Ensure human_percentage is correct
-        if "ai_percentage" in result:
-            result["human_percentage"] = 100 - result["ai_percentage"]
+        result["human_percentage"] = 100 - result["ai_percentage"]
         
         return result
     
     except Exception as e:
-        print(f"AI detection error: {e}")
+        logger.error("AI detection error: %s", e)
         return {
             "ai_percentage": 0,
             "human_percentage": 100,
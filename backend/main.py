@@ -1,46 +1,77 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional
+from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
 import asyncio
-import json
+import logging
+import os
+import queue
+import orjson
+import zlib
+
+from cachetools import TTLCache
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from gemini_client import acall_gemini, build_prompt, parse_analysis_response, chat_about_repo, stream_chat_about_repo, detect_ai_generated_code, clip_repo_content, warm_up_gemini, AnalysisResponse, analysis_model, GeminiAPIError, GeminiTimeoutError, GeminiConnectionError
+from utils import clone_repo_async, read_code_files, cleanup_repository, close_github_client, find_cached_snapshot, get_clone_sha, cache_snapshot, validate_github_url, InvalidRepoError, CloneFailedError, EmptyRepoError, get_file_tree, extract_dependencies
+from db import RepoAnalysis, AsyncSessionLocal, get_db, init_db
+
+
+def _configure_logging() -> QueueListener:
+    """
+    Route app logs through a queue so request handlers never block on
+    stderr; the returned listener does the writing on its own thread.
+    """
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    root = logging.getLogger()
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    root.addHandler(QueueHandler(log_queue))
+    return QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+
+_log_listener = _configure_logging()
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    _log_listener.start()
+    # Create tables if not exist (run once at startup)
+    await init_db()
+    await warm_up_gemini()
+    try:
+        yield
+    finally:
+        await close_github_client()
+        _log_listener.stop()
 
-from gemini_client import call_gemini, build_prompt, chat_about_repo, detect_ai_generated_code, GeminiAPIError, GeminiTimeoutError, GeminiConnectionError
-from utils import clone_repo, read_code_files, cleanup_repository, validate_github_url, InvalidRepoError, CloneFailedError, EmptyRepoError, get_file_tree, extract_dependencies
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Code Archaeologist API",
     description="AI-powered codebase analysis using Gemini",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Enable CORS for frontend
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:5173", "http://localhost:5174", "http://localhost:3000", "*"],
+    allow_origins=["http://localhost:5173", "http://localhost:5174", "http://localhost:3000"],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "authorization"],
 )
 
 
-# Database imports
-from db import SessionLocal, RepoAnalysis, Base, engine
-from sqlalchemy.orm import Session
-
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-# Create tables if not exist (run once at startup)
-Base.metadata.create_all(bind=engine)
-
-
 # Request/Response Models
 class AnalyzeRequest(BaseModel):
     repo: str = Field(..., description="GitHub repository URL (e.g., https://github.com/username/repo.git)")
@@ -83,8 +114,80 @@ async def health_check():
 # Main analyze endpoint
 from fastapi import Depends
 
+# Stored analyses recently served, so bursts for the same repo skip the DB
+_analysis_cache = TTLCache(maxsize=1024, ttl=60)
+_analysis_lookups = {}  # repo_url -> in-flight lookup task
+
+
+async def _load_stored_analysis(repo_url: str) -> Optional[dict]:
+    """Query the stored analysis for repo_url in its own session."""
+    async with AsyncSessionLocal() as session:
+        existing = (
+            await session.execute(select(RepoAnalysis).where(RepoAnalysis.repo_url == repo_url))
+        ).scalar_one_or_none()
+    if not existing:
+        return None
+
+    cached = {
+        "modules": orjson.loads(existing.modules),
+        "architecture": existing.architecture,
+        "technical_debt": existing.technical_debt,
+        "technical_debt_suggestions": getattr(existing, "technical_debt_suggestions", ""),
+        "onboarding_guide": existing.onboarding_guide,
+        # Optionally add file_tree, dependencies, ai_detection if you store them
+    }
+    _analysis_cache[repo_url] = cached
+    return cached
+
+
+async def _get_stored_analysis(repo_url: str) -> Optional[dict]:
+    """
+    Return the stored analysis response for repo_url, or None if it hasn't
+    been analyzed. Concurrent lookups for the same URL await one shared
+    query task, hits or misses alike; the task uses its own session so a
+    cancelled caller can't take it down for the others.
+    """
+    cached = _analysis_cache.get(repo_url)
+    if cached is not None:
+        return cached
+
+    task = _analysis_lookups.get(repo_url)
+    if task is None:
+        task = asyncio.create_task(_load_stored_analysis(repo_url))
+        _analysis_lookups[repo_url] = task
+        # Waiters hold their own reference, so dropping the entry once the
+        # query is done never strands anyone
+        task.add_done_callback(lambda _: _analysis_lookups.pop(repo_url, None))
+    return await asyncio.shield(task)
+
+
+async def _persist_analysis(values: dict, code_text: str):
+    """
+    Upsert an analysis row in a single INSERT ... ON CONFLICT round trip.
+    Runs as a background task after the /analyze response has been sent,
+    so it uses its own session. Only the part of code_text that /chat
+    sends to Gemini is stored, compressed off the event loop.
+    """
+    values["code_text_gz"] = await asyncio.to_thread(
+        lambda: zlib.compress(clip_repo_content(code_text).encode("utf-8"), 6)
+    )
+    stmt = insert(RepoAnalysis).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[RepoAnalysis.repo_url],
+        set_={k: stmt.excluded[k] for k in values if k != "repo_url"}
+    )
+    try:
+        async with AsyncSessionLocal() as session:
+            await session.execute(stmt)
+            await session.commit()
+    except Exception as e:
+        logger.warning("Failed to save analysis for %s: %s", values["repo_url"], e)
+    finally:
+        _analysis_cache.pop(values["repo_url"], None)
+
+
 @app.post("/analyze")
-async def analyze_repo(request: AnalyzeRequest, db: Session = Depends(get_db)):
+async def analyze_repo(request: AnalyzeRequest, background_tasks: BackgroundTasks):
     """
     Analyze a GitHub repository using Gemini AI.
     
@@ -104,70 +207,88 @@ async def analyze_repo(request: AnalyzeRequest, db: Session = Depends(get_db)):
             detail="Invalid GitHub URL. Use format: https://github.com/username/repo.git"
         )
     
-    # Check if analysis exists in DB
-    existing = db.query(RepoAnalysis).filter(RepoAnalysis.repo_url == repo_url).first()
+    # Check if analysis exists (in-process cache, then DB)
+    existing = await _get_stored_analysis(repo_url)
     if existing:
-        return {
-            "modules": json.loads(existing.modules),
-            "architecture": existing.architecture,
-            "technical_debt": existing.technical_debt,
-            "technical_debt_suggestions": getattr(existing, "technical_debt_suggestions", ""),
-            "onboarding_guide": existing.onboarding_guide,
-            # Optionally add file_tree, dependencies, ai_detection if you store them
-        }
+        return existing
 
     repo_path = None
     try:
-        # 1. Clone repository
-        print(f"Step 1: Cloning repository: {repo_url}")
-        try:
-            repo_path = await asyncio.to_thread(clone_repo, repo_url)
-        except InvalidRepoError as e:
-            raise HTTPException(status_code=400, detail=str(e))
-        except CloneFailedError as e:
-            raise HTTPException(status_code=502, detail=str(e))
+        # 0. Reuse the cached snapshot of the remote HEAD, if any, instead of cloning
+        cached = await asyncio.to_thread(find_cached_snapshot, repo_url)
+        snapshot = None
+        if cached:
+            head_sha, snapshot = cached
+            logger.info("Using cached snapshot of %s@%s", repo_url, head_sha)
+            code_text = snapshot["code_text"]
+        else:
+            # 1. Clone repository
+            logger.info("Step 1: Cloning repository: %s", repo_url)
+            try:
+                repo_path = await clone_repo_async(repo_url)
+            except InvalidRepoError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            except CloneFailedError as e:
+                raise HTTPException(status_code=502, detail=str(e))
         
-        # 2. Read code files
-        print("Step 2: Reading code files...")
-        try:
-            code_text = await asyncio.to_thread(read_code_files, repo_path)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to read repository files: {str(e)}")
+            # 2. Read code files
+            logger.info("Step 2: Reading code files...")
+            try:
+                code_text = await asyncio.to_thread(read_code_files, repo_path)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to read repository files: {str(e)}")
         
-        if not code_text:
-            raise HTTPException(
-                status_code=400, 
-                detail="Repository appears to be empty or has no supported code files. "
-                       "Supported extensions: .py, .js, .ts, .java, .cpp, .c, .html, .css"
-            )
+            if not code_text:
+                raise HTTPException(
+                    status_code=400, 
+                    detail="Repository appears to be empty or has no supported code files. "
+                           "Supported extensions: .py, .js, .ts, .java, .cpp, .c, .html, .css"
+                )
         
         # Extract repo name from URL
         repo_name = repo_url.rstrip('/').rstrip('.git').split('/')[-1]
         
         # 3. Build Gemini prompt
-        print("Step 3: Building prompt...")
+        logger.info("Step 3: Building prompt...")
         prompt = build_prompt(code_text, repo_name)
         
-
-        # Save code_text for chat endpoint (optional: you can store in DB if needed)
-        chat_content = code_text
         
-        # 3.5 Extract file tree and dependencies
-        print("Step 3.5: Extracting file tree and dependencies...")
-        try:
-            file_tree = await asyncio.to_thread(get_file_tree, repo_path)
-            dependencies = await asyncio.to_thread(extract_dependencies, repo_path)
-        except Exception as e:
-            print(f"Warning: Failed to extract file tree/dependencies: {e}")
-            file_tree = {"name": "root", "type": "folder", "children": []}
-            dependencies = {"nodes": [], "edges": []}
+        # 3.5 / 3.6 / 4. File tree, dependencies, AI detection and the main
+        # Gemini call are independent, so run them concurrently
+        logger.info("Step 4: Calling Gemini API, detecting AI code, extracting file tree and dependencies...")
+        main_task = asyncio.create_task(acall_gemini(prompt, schema=AnalysisResponse, gen_model=analysis_model))
+        ai_task = asyncio.create_task(detect_ai_generated_code(code_text))
+        if snapshot:
+            file_tree, dependencies = snapshot["file_tree"], snapshot["dependencies"]
+            gemini_response, ai_detection = await asyncio.gather(
+                main_task, ai_task, return_exceptions=True
+            )
+        else:
+            tree_task = asyncio.create_task(asyncio.to_thread(get_file_tree, repo_path))
+            dep_task = asyncio.create_task(asyncio.to_thread(extract_dependencies, repo_path))
+            # Snapshots are keyed on what was actually checked out: a shared
+            # clone may predate the current remote HEAD
+            sha_task = asyncio.create_task(asyncio.to_thread(get_clone_sha, repo_path))
+            gemini_response, ai_detection, file_tree, dependencies, head_sha = await asyncio.gather(
+                main_task, ai_task, tree_task, dep_task, sha_task, return_exceptions=True
+            )
+            
+            if isinstance(file_tree, Exception) or isinstance(dependencies, Exception):
+                logger.warning(
+                    "Failed to extract file tree/dependencies: %s",
+                    file_tree if isinstance(file_tree, Exception) else dependencies
+                )
+                file_tree = {"name": "root", "type": "folder", "children": []}
+                dependencies = {"nodes": [], "edges": []}
+            elif isinstance(head_sha, str):
+                background_tasks.add_task(cache_snapshot, repo_url, head_sha, {
+                    "code_text": code_text,
+                    "file_tree": file_tree,
+                    "dependencies": dependencies,
+                })
         
-        # 3.6 Detect AI-generated code
-        print("Step 3.6: Detecting AI-generated code...")
-        try:
-            ai_detection = await asyncio.to_thread(detect_ai_generated_code, code_text)
-        except Exception as e:
-            print(f"Warning: Failed to detect AI code: {e}")
+        if isinstance(ai_detection, Exception):
+            logger.warning("Failed to detect AI code: %s", ai_detection)
             ai_detection = {
                 "ai_percentage": 0,
                 "human_percentage": 100,
@@ -178,54 +299,43 @@ async def analyze_repo(request: AnalyzeRequest, db: Session = Depends(get_db)):
                 "recommendation": ""
             }
         
-        # 4. Call Gemini hub API
-        print("Step 4: Calling Gemini API...")
-        try:
-            gemini_response = await asyncio.to_thread(call_gemini, prompt)
-        except GeminiTimeoutError as e:
-            raise HTTPException(status_code=504, detail=str(e))
-        except GeminiConnectionError as e:
-            raise HTTPException(status_code=503, detail=str(e))
-        except GeminiAPIError as e:
-            raise HTTPException(status_code=502, detail=str(e))
+        if isinstance(gemini_response, GeminiTimeoutError):
+            raise HTTPException(status_code=504, detail=str(gemini_response))
+        elif isinstance(gemini_response, GeminiConnectionError):
+            raise HTTPException(status_code=503, detail=str(gemini_response))
+        elif isinstance(gemini_response, GeminiAPIError):
+            raise HTTPException(status_code=502, detail=str(gemini_response))
+        elif isinstance(gemini_response, Exception):
+            raise gemini_response
         
         # 5. Parse and return JSON response
-        print("Step 5: Parsing response...")
+        logger.info("Step 5: Parsing response...")
         try:
-            # Try to parse as JSON
-            result = json.loads(gemini_response)
-        except json.JSONDecodeError:
-            # If not valid JSON, wrap the response
-            result = {
-                "architecture": gemini_response,
-                "modules": {},
-                "technical_debt": "",
-                "onboarding_guide": ""
-            }
+            result = parse_analysis_response(gemini_response)
+        except GeminiAPIError as e:
+            raise HTTPException(status_code=502, detail=str(e))
         
         # Add file tree and dependencies to result
         result["file_tree"] = file_tree
         result["dependencies"] = dependencies
         result["ai_detection"] = ai_detection
         
-        # Save analysis to DB
-        analysis = RepoAnalysis(
+        # Save analysis to DB after the response is sent, with code_text so
+        # /chat doesn't have to re-clone the repository
+        background_tasks.add_task(_persist_analysis, dict(
             repo_url=repo_url,
-            modules=json.dumps(result.get("modules", {})),
+            modules=orjson.dumps(result.get("modules", {})).decode("utf-8"),
             architecture=result.get("architecture", ""),
             technical_debt=result.get("technical_debt", ""),
             onboarding_guide=result.get("onboarding_guide", ""),
-            technical_debt_suggestions=result.get("technical_debt_suggestions", "")
-        )
-        db.add(analysis)
-        db.commit()
-        db.refresh(analysis)
+            technical_debt_suggestions=result.get("technical_debt_suggestions", ""),
+        ), code_text)
         return result
     
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Analysis error: {e}")
+        logger.exception("Analysis error: %s", e)
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
     
     finally:
@@ -235,42 +345,68 @@ async def analyze_repo(request: AnalyzeRequest, db: Session = Depends(get_db)):
 
 
 
-# Chat endpoint
-@app.post("/chat", response_model=ChatResponse)
-async def chat_with_repo(request: ChatRequest, db: Session = Depends(get_db)):
+async def _get_chat_content(repo_url: str, db: AsyncSession) -> str:
     """
-    Chat about an analyzed repository using Gemini AI.
+    Load the stored code text for an analyzed repository.
+    Raises 400 if the repository hasn't been analyzed yet.
     """
-    repo_url = request.repo.strip()
-
     # Check if repo was analyzed
-    analysis = db.query(RepoAnalysis).filter(RepoAnalysis.repo_url == repo_url).first()
+    analysis = (
+        await db.execute(select(RepoAnalysis).where(RepoAnalysis.repo_url == repo_url))
+    ).scalar_one_or_none()
     if not analysis:
         raise HTTPException(
             status_code=400,
             detail="Repository not found. Please analyze it first using /analyze endpoint."
         )
 
-    # You may want to store code_text in DB for chat, or re-run code extraction if needed
-    # For now, just return a placeholder or error if not available
-    repo_content = ""  # TODO: Store/retrieve code_text for chat if needed
+    if not analysis.code_text_gz:
+        return ""
+    return await asyncio.to_thread(
+        lambda: zlib.decompress(analysis.code_text_gz).decode("utf-8")
+    )
+
+
+# Chat endpoint
+@app.post("/chat", response_model=ChatResponse)
+async def chat_with_repo(request: ChatRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Chat about an analyzed repository using Gemini AI.
+    """
+    repo_url = request.repo.strip()
+    repo_content = await _get_chat_content(repo_url, db)
     history = [{"role": msg.role, "content": msg.content} for msg in request.history]
 
     try:
-        response = await asyncio.to_thread(
-            chat_about_repo,
+        response = await chat_about_repo(
             repo_content,
             repo_url,
             request.question,
             history
         )
-        return ChatResponse(response=response)
+        # Built from our own str, so skip re-validation
+        return ChatResponse.model_construct(response=response)
 
     except Exception as e:
-        print(f"Chat error: {e}")
+        logger.exception("Chat error: %s", e)
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
 
 
+@app.post("/chat/stream")
+async def stream_chat_with_repo(request: ChatRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Chat about an analyzed repository, streaming the answer as plain text.
+    """
+    repo_url = request.repo.strip()
+    repo_content = await _get_chat_content(repo_url, db)
+    history = [{"role": msg.role, "content": msg.content} for msg in request.history]
+
+    return StreamingResponse(
+        stream_chat_about_repo(repo_content, repo_url, request.question, history),
+        media_type="text/plain; charset=utf-8"
+    )
+
+
 # Run with: uvicorn main:app --reload --port 8000
 if __name__ == "__main__":
     import uvicorn
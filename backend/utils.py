@@ -1,10 +1,32 @@
+import ast
+import errno
+import asyncio
 import os
+import logging
 import shutil
+import stat
 import tempfile
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from git import Repo, GitCommandError, InvalidGitRepositoryError
+from git import Git, Repo, GitCommandError, InvalidGitRepositoryError
+import diskcache
+import httpx
 import re
 
+logger = logging.getLogger(__name__)
+
+# Precompiled patterns
+_GITHUB_URL_RE = re.compile(r'^https?://github\.com/[\w.-]+/[\w.-]+(\.git)?/?$')
+_VALID_GITHUB_URL_RE = re.compile(r'^https?://github\.com/[a-zA-Z0-9_-]+/[a-zA-Z0-9_.-]+(\.git)?$')
+_GH_OWNER_REPO_RE = re.compile(r'https?://github\.com/([^/]+)/([^/]+?)(?:\.git)?$')
+_PY_IMPORT_RE = re.compile(r'^(?:from\s+([\w.]+)\s+import|import\s+([\w.]+))', re.MULTILINE)
+_JS_IMPORT_RE = re.compile(r'''(?:import\s+.*?\s+from\s+['"](.+?)['"]|require\s*\(\s*['"](.+?)['"]\s*\))''')
+_TOP_LEVEL_LINE_RE = re.compile(r'\n(?=[^\s#])')
+
 
 # Custom Exceptions
 class InvalidRepoError(Exception):
@@ -22,12 +44,161 @@ class EmptyRepoError(Exception):
     pass
 
 
+# File selection sets, built once. Extensions are lowercase without the dot.
+
+# Directories never descended into
+_EXCLUDE_DIRS = frozenset({
+    'node_modules', '.git', '__pycache__', 'venv', 'env', '.venv',
+    'dist', 'build', 'target', '.idea', '.vscode', 'coverage',
+    '.next', '.nuxt', 'vendor', '.cache'
+})
+_CONTENT_EXCLUDE_DIRS = _EXCLUDE_DIRS | {'packages'}
+_DEPENDENCY_EXCLUDE_DIRS = frozenset({
+    'node_modules', '.git', '__pycache__', 'venv', 'env', '.venv',
+    'dist', 'build', 'target', '.idea', '.vscode', 'coverage'
+})
+
+# read_code_files
+_CODE_EXTS = frozenset({'py', 'js', 'ts', 'java', 'cpp', 'c', 'html', 'css', 'ipynb', 'jsx', 'tsx'})
+
+# get_repository_content
+_BROAD_EXTS = frozenset({
+    'py', 'js', 'jsx', 'ts', 'tsx', 'java', 'go', 'rs', 'rb',
+    'php', 'cs', 'cpp', 'c', 'h', 'hpp', 'swift', 'kt', 'scala',
+    'md', 'txt', 'json', 'yaml', 'yml', 'toml', 'ini', 'cfg',
+    'html', 'css', 'scss', 'less', 'sql', 'sh', 'bash', 'zsh',
+    'dockerfile', 'ipynb', 'r', 'jl', 'm', 'mat'
+})
+_BROAD_NAMES = frozenset({'.gitignore', '.env.example', 'Makefile', 'Dockerfile'})
+
+# get_file_tree
+_TREE_EXTS = frozenset({
+    'py', 'js', 'jsx', 'ts', 'tsx', 'java', 'go', 'rs', 'rb',
+    'php', 'cs', 'cpp', 'c', 'h', 'hpp', 'swift', 'kt',
+    'html', 'css', 'scss', 'json', 'yaml', 'yml', 'md',
+    'ipynb', 'r', 'jl'
+})
+_TREE_NAMES = frozenset({
+    'package.json', 'README.md', 'requirements.txt',
+    'Dockerfile', 'docker-compose.yml', '.gitignore'
+})
+
+# get_repository_content: root files always included first
+_IMPORTANT_FILES = ('README.md', 'package.json', 'pyproject.toml', 'Cargo.toml',
+                    'go.mod', 'pom.xml', 'build.gradle', 'requirements.txt')
+
+# extract_dependencies
+_DEP_EXTS = frozenset({'py', 'js', 'jsx', 'ts', 'tsx'})
+
+
+def _bare_ext(name: str) -> str:
+    """Lowercase extension without the dot ('' for none or dotfiles, like Path.suffix)."""
+    stem, dot, ext = name.rpartition('.')
+    return ext.lower() if dot and stem else ''
+
+
+# Paths checked out after cloning: everything read_code_files,
+# get_repository_content, get_file_tree and extract_dependencies look
+# at. Other blobs are never downloaded. Sparse patterns are
+# case-sensitive, so the upper-case spelling is listed too.
+_SPARSE_EXTS = _CODE_EXTS | _BROAD_EXTS | _TREE_EXTS | _DEP_EXTS
+SPARSE_CHECKOUT_PATTERNS = sorted(
+    {f'*.{ext}' for ext in _SPARSE_EXTS}
+    | {f'*.{ext.upper()}' for ext in _SPARSE_EXTS}
+) + sorted(_TREE_NAMES | _BROAD_NAMES) + [f'/{name}' for name in _IMPORTANT_FILES]
+
+
+def _clone_parent_dir():
+    """
+    Parent directory for clones: a RAM-backed tmpfs (/dev/shm, then
+    $XDG_RUNTIME_DIR) when writable, so short-lived checkouts never hit
+    the disk. None falls back to the default temp dir.
+    """
+    for candidate in ('/dev/shm', os.environ.get('XDG_RUNTIME_DIR')):
+        if candidate and os.path.isdir(candidate) and os.access(candidate, os.W_OK):
+            return candidate
+    return None
+
+
+def _out_of_space(e: Exception) -> bool:
+    """True if e is (or git reported) ENOSPC, e.g. a full /dev/shm."""
+    if isinstance(e, OSError) and e.errno == errno.ENOSPC:
+        return True
+    return "no space left on device" in str(e).lower()
+
+
+# Live clones shared within the process: normalized URL -> [path, refcount].
+# cleanup_repository only deletes a clone once its last user releases it.
+_clone_cache = {}
+_clone_keys = {}  # path -> normalized URL
+_clone_lock = threading.Lock()
+
+
 def clone_repo(repo_url: str) -> str:
+    """
+    Clone a GitHub repository into a temporary folder, or return the
+    existing clone if the same repository is already checked out in this
+    process. Every call must be paired with cleanup_repository.
+    """
+    # Validate URL format first
+    if not repo_url or not isinstance(repo_url, str):
+        raise InvalidRepoError("Repository URL cannot be empty")
+    
+    key = _normalize_repo_url(repo_url)
+    with _clone_lock:
+        cached = _clone_cache.get(key)
+        if cached is not None:
+            cached[1] += 1
+            return cached[0]
+    
+    path = _clone_repo(repo_url)
+    
+    with _clone_lock:
+        cached = _clone_cache.get(key)
+        if cached is None:
+            _clone_cache[key] = [path, 1]
+            _clone_keys[path] = key
+            return path
+        # A concurrent call cloned it first; share that one
+        cached[1] += 1
+        shared = cached[0]
+    shutil.rmtree(path, ignore_errors=True)
+    return shared
+
+
+# Clones run git in worker threads; bound how many run at once so a
+# batch of repositories doesn't saturate the network or disk
+MAX_CONCURRENT_CLONES = int(os.getenv("MAX_CONCURRENT_CLONES", "4"))
+_clone_semaphore = asyncio.Semaphore(MAX_CONCURRENT_CLONES)
+
+
+async def clone_repo_async(repo_url: str) -> str:
+    """
+    clone_repo in a worker thread, limited to MAX_CONCURRENT_CLONES at a
+    time. Several repositories can be cloned with asyncio.gather, and
+    clones overlap with other awaits such as fetch_github_readme.
+    """
+    async with _clone_semaphore:
+        return await asyncio.to_thread(clone_repo, repo_url)
+
+
+def _clone_repo(repo_url: str, use_tmpfs: bool = True) -> str:
     """
     Clone a GitHub repository into a temporary folder using gitpython.
     
+    The clone keeps a (sparse) working tree rather than being bare: the
+    file tree, dependency and content readers all work on disk, and with
+    a blobless clone, reading blobs out of a bare repo would trigger one
+    lazy fetch per file instead of the single batched fetch done by
+    checkout.
+    
+    Clones go to tmpfs when available; if it runs out of space (Docker's
+    /dev/shm is 64 MB by default) the clone is retried in the default
+    temp dir.
+    
     Args:
         repo_url: GitHub repository URL (e.g., https://github.com/username/repo.git)
+        use_tmpfs: Try a RAM-backed parent directory first
     
     Returns:
         Local path to the cloned repository
@@ -37,23 +208,34 @@ def clone_repo(repo_url: str) -> str:
         raise InvalidRepoError("Repository URL cannot be empty")
     
     # Check for valid GitHub URL pattern
-    github_pattern = r'^https?://github\.com/[\w.-]+/[\w.-]+(\.git)?/?$'
-    if not re.match(github_pattern, repo_url):
+    if not _GITHUB_URL_RE.match(repo_url):
         raise InvalidRepoError(
             f"Invalid GitHub URL format: '{repo_url}'. "
             "Expected format: https://github.com/username/repository"
         )
     
     # Create a temporary directory
-    temp_dir = tempfile.mkdtemp(prefix="code_archaeologist_")
+    parent_dir = _clone_parent_dir() if use_tmpfs else None
+    try:
+        temp_dir = tempfile.mkdtemp(prefix="code_archaeologist_", dir=parent_dir)
+    except OSError:
+        if parent_dir is None:
+            raise
+        return _clone_repo(repo_url, use_tmpfs=False)
     
     try:
         # Ensure URL ends with .git
         if not repo_url.endswith('.git'):
             repo_url = repo_url + '.git'
         
-        # Clone the repository (shallow clone for speed)
-        Repo.clone_from(repo_url, temp_dir, depth=1)
+        # Shallow, blobless, sparse clone: only HEAD's tree is fetched up front,
+        # and only blobs matching SPARSE_CHECKOUT_PATTERNS are downloaded
+        # (in one batch) when they are checked out
+        repo = Repo.clone_from(
+            repo_url, temp_dir,
+            multi_options=['--depth=1', '--filter=blob:none', '--single-branch', '--no-tags', '--sparse']
+        )
+        repo.git.sparse_checkout('set', '--no-cone', *SPARSE_CHECKOUT_PATTERNS)
         return temp_dir
     
     except GitCommandError as e:
@@ -61,6 +243,10 @@ def clone_repo(repo_url: str) -> str:
         if os.path.exists(temp_dir):
             shutil.rmtree(temp_dir)
         
+        if parent_dir is not None and _out_of_space(e):
+            logger.warning("No space in %s, cloning to the default temp dir", parent_dir)
+            return _clone_repo(repo_url, use_tmpfs=False)
+        
         error_msg = str(e).lower()
         if "not found" in error_msg or "does not exist" in error_msg:
             raise InvalidRepoError(
@@ -86,9 +272,135 @@ def clone_repo(repo_url: str) -> str:
         # Clean up on any other failure
         if os.path.exists(temp_dir):
             shutil.rmtree(temp_dir)
+        if parent_dir is not None and _out_of_space(e):
+            logger.warning("No space in %s, cloning to the default temp dir", parent_dir)
+            return _clone_repo(repo_url, use_tmpfs=False)
         raise CloneFailedError(f"Failed to clone repository: {str(e)}")
 
 
+# Separator line around each file header in concatenated repo content
+_HEADER_SEP = "=" * 60
+
+
+def _append_file(parts: list, rel_path: str, content: str):
+    """
+    Append one file's header and content to a flat parts buffer that is
+    joined once with "".join(parts).
+    """
+    if parts:
+        parts.append("\n")
+    parts.extend(("\n", _HEADER_SEP, "\nFile: ", rel_path, "\n", _HEADER_SEP, "\n", content))
+
+
+# File reads block in the kernel with the GIL released, so a thread pool
+# overlaps their latency
+_READ_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+
+# A UTF-8 character is at most 4 bytes, so this many bytes always covers
+# the first N characters of a file
+_MAX_UTF8_CHAR_BYTES = 4
+
+
+def _read_text(path: str, max_bytes: int = None):
+    """
+    Read a file as UTF-8 (ignoring bad bytes); None if it can't be read.
+    One read() sized from fstat and a single decode, instead of going
+    through TextIOWrapper's chunked incremental decoding. With max_bytes,
+    at most that many bytes are read.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        size = os.fstat(fd).st_size
+        remaining = max_bytes if max_bytes is not None else float('inf')
+        chunks = []
+        while remaining > 0:
+            # Loop in case the file grew or the OS returns a short read
+            chunk = os.read(fd, int(min(max(size, 65536), remaining)))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        data = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+        return data.decode('utf-8', 'ignore')
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+
+def _map_files(fn, paths: list, *args) -> list:
+    """Apply fn(path, *arg_items) to paths concurrently, results in input order."""
+    if len(paths) < 2:
+        return list(map(fn, paths, *args))
+    with ThreadPoolExecutor(max_workers=min(_READ_WORKERS, len(paths))) as executor:
+        return list(executor.map(fn, paths, *args))
+
+
+def _read_files(paths: list, max_bytes: int = None) -> list:
+    """Read paths concurrently, returning contents (or None) in input order."""
+    return _map_files(_read_text, paths, [max_bytes] * len(paths))
+
+
+def _walk_code(repo_path, include_exts, exclude_dirs, include_names=frozenset()):
+    """
+    Yield os.DirEntry objects for files under repo_path whose extension
+    (lowercase, without the dot) is in include_exts or whose name is in
+    include_names. Directories named in exclude_dirs are not entered.
+    
+    Built on os.scandir so the is_dir/is_file checks reuse the cached
+    DirEntry type instead of extra stat() calls. Order matches os.walk.
+    Extensions are matched with a single str.endswith(tuple) call.
+    Symlinks are skipped and other filesystems are not entered, so link
+    loops or mounts inside a repo can't blow up the walk.
+    """
+    suffixes = tuple('.' + ext for ext in include_exts)
+    try:
+        root_dev = os.stat(repo_path).st_dev
+    except OSError:
+        return
+    stack = [str(repo_path)]
+    while stack:
+        try:
+            scanner = os.scandir(stack.pop())
+        except OSError:
+            continue
+        subdirs = []
+        with scanner:
+            for entry in scanner:
+                name = entry.name
+                try:
+                    if entry.is_symlink():
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        if (name not in exclude_dirs
+                                and entry.stat(follow_symlinks=False).st_dev == root_dev):
+                            subdirs.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                except OSError:
+                    continue
+                if name in include_names:
+                    yield entry
+                elif name.lower().endswith(suffixes):
+                    yield entry
+        # Push in reverse so subdirectories are visited in scandir order
+        stack.extend(reversed(subdirs))
+
+
+def _rel_start(repo_root: str) -> int:
+    """
+    Index where the repo-relative part starts in paths under repo_root.
+    Walked paths are built by joining onto repo_root, so slicing there
+    is equivalent to Path.relative_to without the per-file Path objects.
+    """
+    return len(repo_root.rstrip(os.sep)) + 1
+
+
 def read_code_files(repo_path: str) -> str:
     """
     Read all code files from a repository and concatenate their contents.
@@ -99,42 +411,24 @@ def read_code_files(repo_path: str) -> str:
     Returns:
         Single string containing all code file contents
     """
-    # File extensions to include
-    CODE_EXTENSIONS = {'.py', '.js', '.ts', '.java', '.cpp', '.c', '.html', '.css', '.ipynb', '.jsx', '.tsx'}
+    repo_root = str(Path(repo_path))
+    rel_start = _rel_start(repo_root)
     
-    # Directories to exclude
-    EXCLUDE_DIRS = {
-        'node_modules', '.git', '__pycache__', 'venv', 'env', '.venv',
-        'dist', 'build', 'target', '.idea', '.vscode', 'coverage',
-        '.next', '.nuxt', 'vendor', '.cache'
-    }
+    # Walk through the repository
+    rel_paths = []
+    abs_paths = []
+    for entry in _walk_code(repo_root, _CODE_EXTS, _EXCLUDE_DIRS):
+        rel_paths.append(entry.path[rel_start:])
+        abs_paths.append(entry.path)
     
     content_parts = []
-    repo_path = Path(repo_path)
+    for relative_path, content in zip(rel_paths, _read_files(abs_paths)):
+        if content is None:
+            continue
+        # Add file header and content
+        _append_file(content_parts, relative_path, content)
     
-    # Walk through the repository
-    for root, dirs, files in os.walk(repo_path):
-        # Filter out excluded directories
-        dirs[:] = [d for d in dirs if d not in EXCLUDE_DIRS]
-        
-        for file in files:
-            file_path = Path(root) / file
-            suffix = file_path.suffix.lower()
-            
-            # Only include specified code file extensions
-            if suffix not in CODE_EXTENSIONS:
-                continue
-            
-            try:
-                relative_path = file_path.relative_to(repo_path)
-                content = file_path.read_text(encoding='utf-8', errors='ignore')
-                
-                # Add file header and content
-                content_parts.append(f"\n{'='*60}\nFile: {relative_path}\n{'='*60}\n{content}")
-            except Exception:
-                pass
-    
-    return "\n".join(content_parts)
+    return "".join(content_parts)
 
 
 # Alias for backward compatibility
@@ -147,156 +441,284 @@ def get_repository_content(repo_path: str, max_files: int = 50, max_file_size: i
     Excludes binary files, node_modules, and other non-essential files.
     """
     
-    # File extensions to include
-    INCLUDE_EXTENSIONS = {
-        '.py', '.js', '.jsx', '.ts', '.tsx', '.java', '.go', '.rs', '.rb',
-        '.php', '.cs', '.cpp', '.c', '.h', '.hpp', '.swift', '.kt', '.scala',
-        '.md', '.txt', '.json', '.yaml', '.yml', '.toml', '.ini', '.cfg',
-        '.html', '.css', '.scss', '.less', '.sql', '.sh', '.bash', '.zsh',
-        '.dockerfile', '.gitignore', '.env.example', 'Makefile', 'Dockerfile',
-        '.ipynb', '.r', '.R', '.jl', '.m', '.mat'
-    }
-    
-    # Directories to exclude
-    EXCLUDE_DIRS = {
-        'node_modules', '.git', '__pycache__', 'venv', 'env', '.venv',
-        'dist', 'build', 'target', '.idea', '.vscode', 'coverage',
-        '.next', '.nuxt', 'vendor', 'packages', '.cache'
-    }
-    
-    content_parts = []
-    files_processed = 0
-    
-    repo_path = Path(repo_path)
+    repo_root = str(Path(repo_path))
+    rel_start = _rel_start(repo_root)
     
     # First, include important root files
-    important_files = ['README.md', 'package.json', 'pyproject.toml', 'Cargo.toml', 
-                       'go.mod', 'pom.xml', 'build.gradle', 'requirements.txt']
-    
-    for filename in important_files:
-        file_path = repo_path / filename
-        if file_path.exists() and file_path.is_file():
-            try:
-                content = file_path.read_text(encoding='utf-8', errors='ignore')
-                content_parts.append(f"\n{'='*60}\nFile: {filename}\n{'='*60}\n{content[:max_file_size]}")
-                files_processed += 1
-            except Exception:
-                pass
+    # (relative path, absolute path, is important file, size in bytes)
+    candidates = []
+    for filename in _IMPORTANT_FILES:
+        file_path = os.path.join(repo_root, filename)
+        if os.path.isfile(file_path) and not os.path.islink(file_path):
+            candidates.append((filename, file_path, True, os.path.getsize(file_path)))
     
     # Then walk through the repository
-    for root, dirs, files in os.walk(repo_path):
-        # Filter out excluded directories
-        dirs[:] = [d for d in dirs if d not in EXCLUDE_DIRS]
-        
-        if files_processed >= max_files:
+    for entry in _walk_code(repo_root, _BROAD_EXTS, _CONTENT_EXCLUDE_DIRS, _BROAD_NAMES):
+        if len(candidates) >= max_files:
             break
         
-        for file in files:
-            if files_processed >= max_files:
-                break
-            
-            file_path = Path(root) / file
-            relative_path = file_path.relative_to(repo_path)
-            
-            # Skip if already processed or doesn't match extensions
-            if str(relative_path) in important_files:
-                continue
-            
-            # Check extension
-            suffix = file_path.suffix.lower()
-            if suffix not in INCLUDE_EXTENSIONS and file not in INCLUDE_EXTENSIONS:
-                continue
-            
-            try:
-                content = file_path.read_text(encoding='utf-8', errors='ignore')
-                if len(content) > max_file_size:
-                    content = content[:max_file_size] + "\n... [truncated]"
-                
-                content_parts.append(f"\n{'='*60}\nFile: {relative_path}\n{'='*60}\n{content}")
-                files_processed += 1
-            except Exception:
-                pass
+        relative_path = entry.path[rel_start:]
+        
+        # Skip if already processed
+        if relative_path in _IMPORTANT_FILES:
+            continue
+        
+        try:
+            size = entry.stat().st_size
+        except OSError:
+            continue
+        candidates.append((relative_path, entry.path, False, size))
+    
+    # Only read as many bytes as can survive truncation, so huge
+    # minified/generated files aren't read in full
+    max_bytes = max_file_size * _MAX_UTF8_CHAR_BYTES
+    content_parts = []
+    contents = _read_files([path for _, path, _, _ in candidates], max_bytes)
+    for (relative_path, _, important, size), content in zip(candidates, contents):
+        if content is None:
+            continue
+        if important:
+            content = content[:max_file_size]
+        elif len(content) > max_file_size or size > max_bytes:
+            content = content[:max_file_size] + "\n... [truncated]"
+        
+        _append_file(content_parts, relative_path, content)
     
-    return "\n".join(content_parts)
+    return "".join(content_parts)
+
+
+# On-disk cache of repository snapshots keyed by (repo_url, HEAD sha), so
+# re-analyzing an unchanged commit skips the clone entirely
+REPO_CACHE_DIR = os.getenv(
+    "REPO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "code_archaeologist_cache")
+)
+REPO_CACHE_SIZE_LIMIT = 1024 ** 3  # 1 GiB
+_repo_cache = None
+
+
+def _private_dir(path: str) -> str:
+    """
+    Create path as a 0700 directory, or make sure an existing one is a
+    real directory owned by this user (tightening it to 0700). The default
+    lives under world-writable /tmp, where another user could otherwise
+    pre-create it and plant cache entries.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if stat.S_ISLNK(st.st_mode) or not stat.S_ISDIR(st.st_mode):
+        raise PermissionError(f"{path} is not a directory")
+    if hasattr(os, 'getuid') and st.st_uid != os.getuid():
+        raise PermissionError(f"{path} is owned by another user")
+    if st.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return path
+
+
+def _get_repo_cache() -> diskcache.Cache:
+    global _repo_cache
+    if _repo_cache is None:
+        # JSONDisk so values are never unpickled
+        _repo_cache = diskcache.Cache(
+            _private_dir(REPO_CACHE_DIR),
+            size_limit=REPO_CACHE_SIZE_LIMIT,
+            disk=diskcache.JSONDisk
+        )
+    return _repo_cache
+
+
+def _normalize_repo_url(repo_url: str) -> str:
+    repo_url = repo_url.strip().rstrip('/')
+    if repo_url.endswith('.git'):
+        repo_url = repo_url[:-4]
+    return repo_url
+
+
+# Upper bound on the ls-remote that validates a cached snapshot
+LS_REMOTE_TIMEOUT = 5
+
+
+def get_head_sha(repo_url: str):
+    """
+    Return the commit SHA of the remote HEAD using one `git ls-remote`
+    round trip (no clone), or None if it can't be determined within
+    LS_REMOTE_TIMEOUT seconds.
+    """
+    try:
+        output = Git().ls_remote(
+            _normalize_repo_url(repo_url) + '.git', 'HEAD',
+            kill_after_timeout=LS_REMOTE_TIMEOUT
+        )
+    except Exception as e:
+        logger.warning("ls-remote failed for %s: %s", repo_url, e)
+        return None
+    sha = output.split('\t', 1)[0].strip()
+    return sha or None
+
+
+def get_clone_sha(repo_path: str):
+    """Commit SHA checked out in a local clone, or None."""
+    try:
+        return Repo(repo_path).head.commit.hexsha
+    except Exception as e:
+        logger.warning("Could not read HEAD of %s: %s", repo_path, e)
+        return None
+
+
+def find_cached_snapshot(repo_url: str):
+    """
+    Return (sha, snapshot) if a snapshot of repo_url's current remote HEAD
+    is cached, else None. The ls-remote round trip is only made for
+    repositories that have some snapshot, so a cold clone pays nothing.
+    """
+    try:
+        if _get_repo_cache().get((_normalize_repo_url(repo_url),)) is None:
+            return None
+    except Exception as e:
+        logger.warning("Repository cache read failed: %s", e)
+        return None
+    sha = get_head_sha(repo_url)
+    if not sha:
+        return None
+    snapshot = get_cached_snapshot(repo_url, sha)
+    return (sha, snapshot) if snapshot is not None else None
+
+
+def get_cached_snapshot(repo_url: str, sha: str):
+    """
+    Return the cached snapshot dict (code_text, file_tree, dependencies)
+    for repo_url at sha, or None.
+    """
+    try:
+        return _get_repo_cache().get((_normalize_repo_url(repo_url), sha))
+    except Exception as e:
+        logger.warning("Repository cache read failed: %s", e)
+        return None
+
+
+def cache_snapshot(repo_url: str, sha: str, snapshot: dict):
+    """
+    Store a snapshot for repo_url at sha (the clone's own HEAD). A new sha
+    simply misses. Also records the latest sha per repository, which
+    find_cached_snapshot checks before going to the network.
+    """
+    repo_url = _normalize_repo_url(repo_url)
+    try:
+        cache = _get_repo_cache()
+        cache.set((repo_url, sha), snapshot)
+        cache.set((repo_url,), sha)
+    except Exception as e:
+        logger.warning("Repository cache write failed: %s", e)
 
 
 def cleanup_repository(repo_path: str):
     """
-    Clean up a cloned repository directory.
+    Clean up a cloned repository directory. Clones shared through
+    clone_repo are only removed when their last user releases them.
     """
+    with _clone_lock:
+        key = _clone_keys.get(repo_path)
+        if key is not None:
+            cached = _clone_cache[key]
+            cached[1] -= 1
+            if cached[1] > 0:
+                return
+            del _clone_cache[key]
+            del _clone_keys[repo_path]
+    
     try:
         if repo_path and os.path.exists(repo_path):
             shutil.rmtree(repo_path)
     except Exception as e:
-        print(f"Warning: Failed to cleanup {repo_path}: {e}")
+        logger.warning("Failed to cleanup %s: %s", repo_path, e)
 
 
 def validate_github_url(url: str) -> bool:
     """
     Validate that a URL is a valid GitHub repository URL.
     """
-    import re
-    pattern = r'^https?://github\.com/[a-zA-Z0-9_-]+/[a-zA-Z0-9_.-]+(\.git)?$'
-    return bool(re.match(pattern, url.strip()))
+    return bool(_VALID_GITHUB_URL_RE.match(url.strip()))
+
+
+def _tree_sort_key(entry):
+    """Folders first, then case-insensitive name."""
+    return (not entry.is_dir(follow_symlinks=False), entry.name.lower())
 
 
 def get_file_tree(repo_path: str) -> dict:
     """
     Generate a hierarchical file tree structure from a repository.
     
+    Walks iteratively with os.scandir, so each entry's type comes from the
+    cached DirEntry and files are only stat()ed when kept. On a sparse
+    clone from clone_repo, folders holding no checked-out file don't
+    exist on disk and so don't appear in the tree. Symlinks and
+    other filesystems are skipped, as in _walk_code.
+    
     Returns:
         Dictionary representing the folder structure with file info
     """
-    EXCLUDE_DIRS = {
-        'node_modules', '.git', '__pycache__', 'venv', 'env', '.venv',
-        'dist', 'build', 'target', '.idea', '.vscode', 'coverage',
-        '.next', '.nuxt', 'vendor', '.cache'
-    }
-    
-    CODE_EXTENSIONS = {
-        '.py', '.js', '.jsx', '.ts', '.tsx', '.java', '.go', '.rs', '.rb',
-        '.php', '.cs', '.cpp', '.c', '.h', '.hpp', '.swift', '.kt',
-        '.html', '.css', '.scss', '.json', '.yaml', '.yml', '.md',
-        '.ipynb', '.r', '.R', '.jl'
+    repo_root = str(Path(repo_path))
+    rel_start = _rel_start(repo_root)
+    try:
+        root_dev = os.stat(repo_root).st_dev
+    except OSError:
+        root_dev = None
+    tree = {
+        "name": os.path.basename(repo_root),
+        "type": "folder",
+        "path": ".",
+        "children": []
     }
     
-    def build_tree(path: Path, base_path: Path) -> dict:
-        result = {
-            "name": path.name,
-            "type": "folder" if path.is_dir() else "file",
-            "path": str(path.relative_to(base_path))
-        }
+    # (directory path, children list of its node)
+    stack = [(repo_root, tree["children"])]
+    while stack:
+        dir_path, children = stack.pop()
+        try:
+            with os.scandir(dir_path) as it:
+                entries = sorted(it, key=_tree_sort_key)
+        except OSError:
+            continue
         
-        if path.is_dir():
-            children = []
-            try:
-                for child in sorted(path.iterdir(), key=lambda x: (not x.is_dir(), x.name.lower())):
-                    if child.name in EXCLUDE_DIRS:
+        for entry in entries:
+            name = entry.name
+            if name in _EXCLUDE_DIRS:
+                continue
+            # Never follow symlinks or cross into another filesystem
+            if entry.is_symlink():
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                try:
+                    if entry.stat(follow_symlinks=False).st_dev != root_dev:
                         continue
-                    if child.is_file() and child.suffix.lower() not in CODE_EXTENSIONS:
-                        # Include common config files
-                        if child.name not in ['package.json', 'README.md', 'requirements.txt', 
-                                              'Dockerfile', 'docker-compose.yml', '.gitignore']:
-                            continue
-                    child_tree = build_tree(child, base_path)
-                    if child_tree:
-                        children.append(child_tree)
-            except PermissionError:
-                pass
-            result["children"] = children
-        else:
-            # Add file size
-            try:
-                result["size"] = path.stat().st_size
-                result["extension"] = path.suffix.lower()
-            except:
-                result["size"] = 0
-                result["extension"] = ""
-        
-        return result
-    
-    repo_path = Path(repo_path)
-    return build_tree(repo_path, repo_path)
+                except OSError:
+                    continue
+                node = {
+                    "name": name,
+                    "type": "folder",
+                    "path": entry.path[rel_start:],
+                    "children": []
+                }
+                stack.append((entry.path, node["children"]))
+            else:
+                ext = _bare_ext(name)
+                # Include code files and common config files
+                if ext not in _TREE_EXTS and name not in _TREE_NAMES:
+                    continue
+                node = {
+                    "name": name,
+                    "type": "file",
+                    "path": entry.path[rel_start:]
+                }
+                try:
+                    node["size"] = entry.stat().st_size
+                    node["extension"] = '.' + ext if ext else ""
+                except OSError:
+                    node["size"] = 0
+                    node["extension"] = ""
+            children.append(node)
+    
+    return tree
 
 
 def extract_dependencies(repo_path: str) -> dict:
@@ -306,56 +728,42 @@ def extract_dependencies(repo_path: str) -> dict:
     Returns:
         Dictionary with nodes (files) and edges (import relationships)
     """
-    EXCLUDE_DIRS = {
-        'node_modules', '.git', '__pycache__', 'venv', 'env', '.venv',
-        'dist', 'build', 'target', '.idea', '.vscode', 'coverage'
-    }
-    
     nodes = []
     edges = []
     file_map = {}  # Map file paths to node IDs
     
     repo_path = Path(repo_path)
+    rel_start = _rel_start(str(repo_path))
     
-    # First pass: collect all files
+    # Single walk: collect nodes and the paths to read. Imports are
+    # resolved afterwards, once file_map is complete.
+    abs_paths = []
     node_id = 0
-    for root, dirs, files in os.walk(repo_path):
-        dirs[:] = [d for d in dirs if d not in EXCLUDE_DIRS]
-        
-        for file in files:
-            file_path = Path(root) / file
-            suffix = file_path.suffix.lower()
-            
-            if suffix in {'.py', '.js', '.jsx', '.ts', '.tsx'}:
-                rel_path = str(file_path.relative_to(repo_path))
-                nodes.append({
-                    "id": node_id,
-                    "name": file,
-                    "path": rel_path,
-                    "type": suffix[1:],  # Remove the dot
-                    "group": str(file_path.parent.relative_to(repo_path))
+    for entry in _walk_code(repo_path, _DEP_EXTS, _DEPENDENCY_EXCLUDE_DIRS):
+        rel_path = entry.path[rel_start:]
+        nodes.append({
+            "id": node_id,
+            "name": entry.name,
+            "path": rel_path,
+            "type": _bare_ext(entry.name),
+            "group": os.path.dirname(rel_path) or "."
+        })
+        file_map[rel_path] = node_id
+        abs_paths.append(entry.path)
+        node_id += 1
+    
+    # Extract imports. Each worker reads, parses and drops one file, so
+    # only the (small) import lists are kept, never every file's content.
+    for node, imports in zip(nodes, _map_files(_file_imports, abs_paths, nodes)):
+        for imp in imports:
+            # Try to resolve import to a file in the repo
+            target_id = resolve_import(imp, node["path"], file_map, repo_path)
+            if target_id is not None and target_id != node["id"]:
+                edges.append({
+                    "source": node["id"],
+                    "target": target_id,
+                    "import": imp
                 })
-                file_map[rel_path] = node_id
-                node_id += 1
-    
-    # Second pass: extract imports
-    for node in nodes:
-        file_path = repo_path / node["path"]
-        try:
-            content = file_path.read_text(encoding='utf-8', errors='ignore')
-            imports = extract_imports_from_content(content, node["type"], node["path"])
-            
-            for imp in imports:
-                # Try to resolve import to a file in the repo
-                target_id = resolve_import(imp, node["path"], file_map, repo_path)
-                if target_id is not None and target_id != node["id"]:
-                    edges.append({
-                        "source": node["id"],
-                        "target": target_id,
-                        "import": imp
-                    })
-        except Exception:
-            pass
     
     return {
         "nodes": nodes,
@@ -363,23 +771,112 @@ def extract_dependencies(repo_path: str) -> dict:
     }
 
 
+def _file_imports(path: str, node: dict) -> list:
+    """Read one dependency-graph file and return its imports."""
+    content = _read_text(path)
+    if content is None:
+        return []
+    try:
+        return extract_imports_from_content(content, node["type"], node["path"])
+    except Exception:
+        return []
+
+
+# Python imports that are never resolved to repo files
+_PY_SKIP_IMPORT_PREFIXES = ('os', 'sys', 'json', 're', 'typing', 'pathlib',
+                            'collections', 'datetime', 'asyncio', 'functools')
+
+
+# Imports live in the file prologue; only this many leading characters
+# are scanned, so large generated files and embedded data aren't
+_IMPORT_SCAN_CHARS = 8192
+
+
+def _import_prologue(content: str, python: bool = False) -> str:
+    """
+    The first _IMPORT_SCAN_CHARS of content, cut at a line boundary. For
+    Python the cut is before the last top-level statement that starts in
+    range, so the prologue is usually parseable on its own.
+    """
+    if len(content) <= _IMPORT_SCAN_CHARS:
+        return content
+    head = content[:_IMPORT_SCAN_CHARS]
+    cut = -1
+    if python:
+        for match in _TOP_LEVEL_LINE_RE.finditer(head):
+            cut = match.start()
+    else:
+        cut = head.rfind('\n')
+    return head[:cut] if cut > 0 else head
+
+
+# Filename given to ast.parse for analyzed files, so the compiler's
+# SyntaxWarnings (e.g. invalid escape sequences on 3.12+) can be
+# filtered by module without a thread-unsafe catch_warnings
+_AST_FILENAME = '<analyzed source>'
+warnings.filterwarnings('ignore', category=SyntaxWarning, module=re.escape(_AST_FILENAME))
+
+
+def _python_imports(content: str) -> list:
+    """
+    Module names imported in the prologue of a Python file. The line
+    regex is the fast path; ast is only used when an `import` line lists
+    several modules or is continued with a backslash, which the regex
+    would cut short. (Parenthesized `from x import (...)` doesn't need it:
+    the module is on the first line.)
+    """
+    head = _import_prologue(content, python=True)
+    modules = []
+    needs_ast = False
+    for match in _PY_IMPORT_RE.finditer(head):
+        if match.group(2) and not needs_ast:
+            line_end = head.find('\n', match.end())
+            rest = head[match.end():line_end if line_end != -1 else len(head)]
+            rest = rest.split('#', 1)[0].rstrip()
+            needs_ast = ',' in rest or rest.endswith('\\')
+        modules.append(match.group(1) or match.group(2))
+    if needs_ast:
+        # Files that don't parse (e.g. Python 2) keep the regex result
+        return _python_imports_ast(head, content) or modules
+    return modules
+
+
+def _python_imports_ast(head: str, content: str) -> list:
+    """
+    Top-level imports via ast: the prologue, then the whole file if the
+    prologue doesn't parse on its own. Empty if neither parses.
+    """
+    for source in ((head, content) if head is not content else (content,)):
+        try:
+            tree = ast.parse(source, filename=_AST_FILENAME)
+            break
+        except (SyntaxError, ValueError):
+            pass
+    else:
+        return []
+    
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            modules.append('.' * node.level + (node.module or ''))
+    return modules
+
+
 def extract_imports_from_content(content: str, file_type: str, file_path: str) -> list:
     """Extract import statements from file content."""
     imports = []
     
     if file_type == 'py':
         # Python imports
-        import_pattern = r'^(?:from\s+([\w.]+)\s+import|import\s+([\w.]+))'
-        for match in re.finditer(import_pattern, content, re.MULTILINE):
-            imp = match.group(1) or match.group(2)
-            if imp and not imp.startswith(('os', 'sys', 'json', 're', 'typing', 'pathlib', 
-                                           'collections', 'datetime', 'asyncio', 'functools')):
+        for imp in _python_imports(content):
+            if imp and not imp.startswith(_PY_SKIP_IMPORT_PREFIXES):
                 imports.append(imp)
     
     elif file_type in {'js', 'jsx', 'ts', 'tsx'}:
         # JavaScript/TypeScript imports
-        import_pattern = r'(?:import\s+.*?\s+from\s+[\'"](.+?)[\'"]|require\s*\(\s*[\'"](.+?)[\'"]\s*\))'
-        for match in re.finditer(import_pattern, content):
+        for match in _JS_IMPORT_RE.finditer(_import_prologue(content)):
             imp = match.group(1) or match.group(2)
             if imp and imp.startswith(('./', '../')):
                 imports.append(imp)
@@ -421,24 +918,78 @@ def resolve_import(import_path: str, source_file: str, file_map: dict, repo_path
     return None
 
 
+# Shared GitHub API client (created lazily) so repeat calls reuse pooled
+# HTTP/2 connections instead of a fresh TCP + TLS handshake each time
+_gh_client = None
+
+# README memo: (owner, repo) -> (fetched_at, etag, README text). Entries
+# older than the TTL are revalidated with If-None-Match, and a 304 (which
+# GitHub doesn't count against the rate limit) keeps the cached text
+_README_CACHE_MAX_ENTRIES = 1024
+_README_CACHE_TTL = 300
+_readme_cache = OrderedDict()
+
+
+def _get_github_client() -> httpx.AsyncClient:
+    global _gh_client
+    if _gh_client is None:
+        _gh_client = httpx.AsyncClient(
+            http2=True,
+            timeout=10,
+            headers={"Accept": "application/vnd.github.raw"}
+        )
+    return _gh_client
+
+
+async def close_github_client():
+    """Close the shared GitHub API client (call at app shutdown)."""
+    global _gh_client
+    if _gh_client is not None:
+        await _gh_client.aclose()
+        _gh_client = None
+
+
 async def fetch_github_readme(repo_url: str) -> str:
     """
     Fetch README directly from GitHub API (faster than cloning for quick analysis).
     """
     # Extract owner/repo from URL
-    import re
-    match = re.match(r'https?://github\.com/([^/]+)/([^/]+?)(?:\.git)?$', repo_url)
+    match = _GH_OWNER_REPO_RE.match(repo_url)
     if not match:
         return ""
     
     owner, repo = match.groups()
+    key = (owner, repo)
+    cached = _readme_cache.get(key)
+    headers = {}
+    etag = None
+    if cached is not None:
+        _readme_cache.move_to_end(key)
+        fetched_at, etag, text = cached
+        if time.monotonic() - fetched_at < _README_CACHE_TTL:
+            return text
+        if etag:
+            headers["If-None-Match"] = etag
+    
     api_url = f"https://api.github.com/repos/{owner}/{repo}/readme"
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(api_url, headers={"Accept": "application/vnd.github.raw"})
-            if response.status_code == 200:
-                return response.text
+        response = await _get_github_client().get(api_url, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            text = cached[2]
+            # A 304 may omit the ETag; keep the one we sent in that case
+            etag = response.headers.get("ETag") or etag
+        elif response.status_code == 200:
+            # Raw README bytes are UTF-8; decoding directly skips
+            # httpx's charset detection on .text
+            text = response.content.decode('utf-8', 'ignore')
+            etag = response.headers.get("ETag")
+        else:
+            return ""
+        _readme_cache[key] = (time.monotonic(), etag, text)
+        while len(_readme_cache) > _README_CACHE_MAX_ENTRIES:
+            _readme_cache.popitem(last=False)
+        return text
     except Exception:
         pass
     